@@ -3,6 +3,10 @@ use serde::Serialize; // For #[serde(skip)] if TestMetrics is ever serialized
 // use std::collections::VecDeque; // Unused
 use std::time::Instant; // Duration was unused
 
+/// Upper bound on anomalies kept per test. A bad network period can raise an anomaly for
+/// nearly every packet; beyond this many, events are only counted in `anomalies_dropped`.
+pub const MAX_RECORDED_ANOMALIES: usize = 1000;
+
 #[derive(Debug, Default, Serialize)] // Added Serialize for skip attribute
 pub struct TestMetrics {
     pub packets_sent: u64,
@@ -33,12 +37,14 @@ pub struct TestMetrics {
 
     // Store anomalies detected directly related to metrics processing
     pub anomalies: Vec<crate::anomalies::AnomalyEvent>,
+    pub anomalies_dropped: u64, // Anomalies detected after MAX_RECORDED_ANOMALIES was reached
     #[serde(skip)]
     latency_spike_threshold_micros: Option<u128>,
     #[serde(skip)]
     jitter_spike_threshold_micros: Option<u128>,
 
     pub out_of_order_count: u64, // For out-of-order packets
+    pub duplicate_count: u64, // Packets whose sequence number was already received
 }
 
 impl TestMetrics {
@@ -51,6 +57,28 @@ impl TestMetrics {
         self.jitter_spike_threshold_micros = config.jitter_spike_threshold_ms.map(|ms| ms as u128 * 1000);
     }
 
+    /// Milliseconds since the test started; reads the clock, so only call it when needed.
+    fn elapsed_test_time_ms(&self) -> u128 {
+        self.test_start_time.map_or(0, |st| st.elapsed().as_millis())
+    }
+
+    /// Records an anomaly timestamped now, or just counts it once MAX_RECORDED_ANOMALIES are stored.
+    /// The description is built lazily so dropped anomalies cost no formatting or allocation.
+    pub fn record_anomaly<F>(&mut self, anomaly_type: crate::anomalies::AnomalyType, describe: F)
+    where
+        F: FnOnce() -> String,
+    {
+        if self.anomalies.len() >= MAX_RECORDED_ANOMALIES {
+            self.anomalies_dropped += 1;
+            return;
+        }
+        self.anomalies.push(crate::anomalies::AnomalyEvent {
+            timestamp_ms: self.elapsed_test_time_ms(),
+            anomaly_type,
+            description: describe(),
+        });
+    }
+
     pub fn init_start_time(&mut self) {
         if self.test_start_time.is_none() {
             self.test_start_time = Some(Instant::now());
@@ -92,14 +120,10 @@ impl TestMetrics {
             self.last_rtt_micros = Some(rtt_micros);
 
             // Anomaly detection for this RTT and Jitter sample
-            let current_test_time_ms = self.test_start_time.map_or(0, |st| Instant::now().duration_since(st).as_millis());
-
             if let Some(threshold_micros) = self.latency_spike_threshold_micros {
                 if rtt_micros > threshold_micros {
-                    self.anomalies.push(crate::anomalies::AnomalyEvent {
-                        timestamp_ms: current_test_time_ms,
-                        anomaly_type: crate::anomalies::AnomalyType::HighLatencySpike,
-                        description: format!("RTT: {:.2} ms", rtt_micros as f64 / 1000.0),
+                    self.record_anomaly(crate::anomalies::AnomalyType::HighLatencySpike, || {
+                        format!("RTT: {:.2} ms", rtt_micros as f64 / 1000.0)
                     });
                 }
             }
@@ -117,6 +141,18 @@ impl TestMetrics {
         // For now, let's assume we get inter-arrival times from packet timestamps.
     }
 
+    /// Records several received packets at once, for receive loops that count locally and
+    /// flush periodically instead of locking the metrics per packet. No RTT is involved.
+    pub fn record_packets_received_batch(&mut self, packets: u64, bytes: u64) {
+        if packets == 0 {
+            return;
+        }
+        self.init_start_time();
+        self.packets_received += packets;
+        self.bytes_received += bytes;
+        self.bytes_since_last_bandwidth_sample += bytes;
+    }
+
     /// Call this periodically (e.g., every N milliseconds or after X packets)
     /// to record a bandwidth sample.
     pub fn take_bandwidth_sample(&mut self, current_test_time_ms: u128) {
@@ -144,11 +180,8 @@ impl TestMetrics {
         // Anomaly detection for this jitter sample
         if let Some(threshold_micros) = self.jitter_spike_threshold_micros {
             if jitter_sample_micros > threshold_micros {
-                let current_test_time_ms = self.test_start_time.map_or(0, |st| Instant::now().duration_since(st).as_millis());
-                self.anomalies.push(crate::anomalies::AnomalyEvent {
-                    timestamp_ms: current_test_time_ms,
-                    anomaly_type: crate::anomalies::AnomalyType::JitterSpike,
-                    description: format!("Jitter: {:.2} ms", jitter_sample_micros as f64 / 1000.0),
+                self.record_anomaly(crate::anomalies::AnomalyType::JitterSpike, || {
+                    format!("Jitter: {:.2} ms", jitter_sample_micros as f64 / 1000.0)
                 });
             }
         }
@@ -219,12 +252,13 @@ mod metrics_tests {
         assert!(metrics.test_start_time.is_none());
         metrics.init_start_time();
         assert!(metrics.test_start_time.is_some());
-        let first_start_time = metrics.test_start_time.unwrap();
-        // Simulate some time passing, ensure init_start_time doesn't overwrite
-        std::thread::sleep(Duration::from_micros(10));
+        assert_eq!(metrics.last_bandwidth_sample_time_ms, Some(0));
+        // Backdate the start instead of sleeping, so a second call that overwrote it would
+        // always be detected regardless of clock resolution.
+        let first_start_time = Instant::now() - Duration::from_secs(1);
+        metrics.test_start_time = Some(first_start_time);
         metrics.init_start_time();
         assert_eq!(metrics.test_start_time.unwrap(), first_start_time);
-        assert_eq!(metrics.last_bandwidth_sample_time_ms, Some(0));
     }
 
     #[test]
@@ -273,6 +307,21 @@ mod metrics_tests {
         assert!(metrics.max_rtt_micros.is_none());
     }
 
+    #[test]
+    fn test_record_packets_received_batch() {
+        let mut metrics = TestMetrics::new();
+        metrics.record_packets_received_batch(0, 0);
+        assert!(metrics.test_start_time.is_none()); // Empty batch is a no-op
+
+        metrics.record_packets_received_batch(3, 300);
+        metrics.record_packet_received(100, 0);
+        assert_eq!(metrics.packets_received, 4);
+        assert_eq!(metrics.bytes_received, 400);
+        assert_eq!(metrics.bytes_since_last_bandwidth_sample, 400);
+        assert_eq!(metrics.rtt_count, 0);
+        assert!(metrics.test_start_time.is_some());
+    }
+
     #[test]
     fn test_record_jitter_value_separate() { // Renamed to avoid conflict if any other test is named similarly
         let mut metrics = TestMetrics::new();
@@ -311,6 +360,22 @@ mod metrics_tests {
         assert_eq!(metrics.bandwidth_samples[2], (sample_time_ms_3, 0));
     }
 
+    #[test]
+    fn test_record_anomaly_caps_stored_events() {
+        let mut metrics = TestMetrics::new();
+        for i in 0..MAX_RECORDED_ANOMALIES {
+            metrics.record_anomaly(crate::anomalies::AnomalyType::OutOfOrder, || format!("event {}", i));
+        }
+        for _ in 0..5 {
+            metrics.record_anomaly(crate::anomalies::AnomalyType::OutOfOrder, || {
+                panic!("description must not be built for a dropped anomaly")
+            });
+        }
+        assert_eq!(metrics.anomalies.len(), MAX_RECORDED_ANOMALIES);
+        assert_eq!(metrics.anomalies_dropped, 5);
+        assert_eq!(metrics.anomalies[0].description, "event 0"); // Earliest events are kept
+    }
+
     #[test]
     fn test_average_rtt_micros() {
         let mut metrics = TestMetrics::new();
@@ -1,6 +1,6 @@
 // network.rs
 use crate::config::{Protocol, TestConfig, TestMode, TcpBidirectionalMode};
-use crate::packet::CustomPacket;
+use crate::packet::{CustomPacket, PacketHeader};
 use crate::metrics::TestMetrics;
 use std::net::SocketAddr;
 use std::sync::{Arc, Mutex};
@@ -26,12 +26,6 @@ impl From<std::io::Error> for NetworkError {
     }
 }
 
-impl From<bincode::Error> for NetworkError {
-    fn from(err: bincode::Error) -> Self {
-        NetworkError::SerializationError(err.to_string())
-    }
-}
-
 
 // --- Main Dispatch Function ---
 pub async fn run_network_test(
@@ -71,13 +65,13 @@ pub async fn run_network_test(
                 .map_err(|e| NetworkError::InvalidAddress(format!("Invalid listen address: {}", e)))?;
             match config.protocol {
                 Protocol::Udp => {
-                    let socket = Arc::new(UdpSocket::bind(listen_addr).await?);
+                    let socket = Arc::new(udp_bind(listen_addr)?);
                     udp_receive_loop(Arc::clone(&config), socket, metrics).await?;
                 }
                 Protocol::Tcp => {
                     let listener = tcp_listen(listen_addr).await?;
                     println!("TCP Server: Waiting for a connection on {}...", listen_addr);
-                    let (stream, client_addr) = listener.accept().await?;
+                    let (stream, client_addr) = tcp_accept(&listener).await?;
                     println!("TCP Server: Accepted connection from {}", client_addr);
                     let (reader, _writer) = tokio::io::split(stream); // _writer is unused for now
                     // In server-only mode, primarily receives. Sending might be for ACKs.
@@ -107,7 +101,7 @@ pub async fn run_network_test(
                     let metrics_send = Arc::clone(&metrics);
                     let metrics_recv = Arc::clone(&metrics);
 
-                    let listen_socket = Arc::new(UdpSocket::bind(listen_addr).await?);
+                    let listen_socket = Arc::new(udp_bind(listen_addr)?);
                     let recv_socket_clone = Arc::clone(&listen_socket);
 
                     let send_handle = tokio::spawn(async move {
@@ -162,7 +156,7 @@ pub async fn run_network_test(
                             let server_handle = tokio::spawn(async move {
                                 let listener = tcp_listen(listen_addr).await?;
                                 println!("TCP BiDi (Dual): Listening on {} for incoming connection.", listen_addr);
-                                let (stream, client_addr) = listener.accept().await?;
+                                let (stream, client_addr) = tcp_accept(&listener).await?;
                                 println!("TCP BiDi (Dual): Accepted connection from {} for receiving.", client_addr);
                                 let (reader, writer) = tokio::io::split(stream);
 
@@ -222,7 +216,7 @@ pub async fn run_network_test(
                             } else {
                                 let listener = tcp_listen(listen_addr).await?;
                                 println!("TCP BiDi (Single): Listening on {} for incoming connection.", listen_addr);
-                                let (accepted_stream, client_addr) = listener.accept().await?;
+                                let (accepted_stream, client_addr) = tcp_accept(&listener).await?;
                                 stream = accepted_stream;
                                 println!("TCP BiDi (Single): Accepted connection from {}", client_addr);
                             }
@@ -251,7 +245,74 @@ pub async fn run_network_test(
 }
 
 
+// --- Shared send-loop helpers ---
+
+/// Chooses the payload size for each outgoing packet.
+/// The random range (if any) is resolved once when a send loop starts, so each tick is
+/// either a constant or a single draw from a prebuilt distribution.
+struct PacketSizer {
+    fixed_size: usize,
+    random: Option<(rand::rngs::StdRng, rand::distributions::Uniform<usize>)>,
+}
+
+impl PacketSizer {
+    fn new(config: &TestConfig) -> Self {
+        use rand::SeedableRng;
+        PacketSizer {
+            fixed_size: config.packet_size_bytes,
+            random: config.packet_size_range.map(|(min_size, max_size)| {
+                (rand::rngs::StdRng::from_entropy(), rand::distributions::Uniform::new_inclusive(min_size, max_size))
+            }),
+        }
+    }
+
+    /// Largest size `next_size` can return; used to preallocate send buffers.
+    fn max_size(config: &TestConfig) -> usize {
+        config.packet_size_range.map_or(config.packet_size_bytes, |(_, max_size)| max_size)
+    }
+
+    fn next_size(&mut self) -> usize {
+        use rand::distributions::Distribution;
+        match self.random {
+            Some((ref mut rng, ref dist)) => dist.sample(rng),
+            None => self.fixed_size,
+        }
+    }
+}
+
+
 // --- UDP Loops ---
+/// Requested kernel send and receive buffers for UDP test sockets. Linux defaults (~208 KiB) hold
+/// only a few milliseconds of traffic at high rates, so bursts would be dropped by the local socket
+/// and reported as network loss.
+const UDP_SOCKET_BUFFER_SIZE: usize = 4 * 1024 * 1024;
+
+/// Receive buffer length for UDP sockets. Any datagram fits, so large packets are never
+/// silently truncated (which would under-count bytes and shrink echoed replies).
+const MAX_UDP_DATAGRAM_LEN: usize = 65536;
+
+/// Binds a UDP socket with enlarged kernel buffers, for client and server sockets alike (a server
+/// that falls behind during a burst would otherwise lose packets in its receive queue).
+/// tokio's UdpSocket has no buffer setters, so the socket is built with socket2 and then handed to tokio.
+fn udp_bind(local_addr: SocketAddr) -> Result<UdpSocket, NetworkError> {
+    let socket = socket2::Socket::new(
+        socket2::Domain::for_address(local_addr),
+        socket2::Type::DGRAM,
+        Some(socket2::Protocol::UDP),
+    )?;
+    // Best effort, like the TCP buffers: the test still runs with whatever the kernel allows.
+    // Requests above net.core.wmem_max / rmem_max are capped silently, which is normal on stock systems.
+    if let Err(e) = socket.set_send_buffer_size(UDP_SOCKET_BUFFER_SIZE) {
+        eprintln!("UDP: Could not set send buffer size: {}", e);
+    }
+    if let Err(e) = socket.set_recv_buffer_size(UDP_SOCKET_BUFFER_SIZE) {
+        eprintln!("UDP: Could not set receive buffer size: {}", e);
+    }
+    socket.set_nonblocking(true)?; // Required by UdpSocket::from_std
+    socket.bind(&local_addr.into())?;
+    Ok(UdpSocket::from_std(socket.into())?)
+}
+
 async fn udp_send_loop(
     config: Arc<TestConfig>,
     remote_addr: SocketAddr,
@@ -262,18 +323,38 @@ async fn udp_send_loop(
     // For BiDi, the socket might be shared if we want to receive ACKs on the same one.
     // Or, it could be a dedicated sending socket.
     // For simplicity, let's use a new socket for sending. The receive_loop will use the listening one.
-    let socket = UdpSocket::bind("0.0.0.0:0").await?;
+    let socket = udp_bind(SocketAddr::from(([0, 0, 0, 0], 0)))?;
     socket.connect(remote_addr).await?; // Connects the UDP socket to a default remote address
     println!("UDP SendLoop: Sending to {} from local addr {}", remote_addr, socket.local_addr()?);
+    let socket = Arc::new(socket);
 
     let test_start_time = metrics.lock().unwrap().test_start_time.unwrap_or_else(Instant::now);
     let test_duration = config.total_duration();
     let tick_interval = config.tick_interval();
 
-    use rand::rngs::StdRng;
-    use rand::SeedableRng;
-    let mut rng = if config.packet_size_range.is_some() { Some(StdRng::from_entropy()) } else { None };
+    let mut packet_sizer = PacketSizer::new(&config);
     let mut sequence_number: u32 = 0;
+    // Reused for every send so the zero-filled payload is not reallocated each tick.
+    let mut packet = CustomPacket::new_echo_request(sequence_number, config.packet_size_bytes);
+    // Encoded datagram, also reused; when the size is unchanged only the header is rewritten.
+    let mut datagram: Vec<u8> = Vec::with_capacity(crate::packet::HEADER_LEN + PacketSizer::max_size(&config));
+
+    // The primary sender measures RTT. Replies are handled by a separate task so sending
+    // follows the tick schedule instead of stalling up to UDP_REPLY_TIMEOUT per packet.
+    // Only the primary sender allocates the send-time ring and the stop channel.
+    let reply_task = if is_primary_sender {
+        let pending_replies = Arc::new(Mutex::new(SendTimes::new()));
+        let (stop_replies_tx, stop_replies_rx) = tokio::sync::oneshot::channel();
+        let handle = tokio::spawn(udp_reply_loop(
+            Arc::clone(&socket),
+            Arc::clone(&pending_replies),
+            Arc::clone(&metrics),
+            stop_replies_rx,
+        ));
+        Some((pending_replies, stop_replies_tx, handle))
+    } else {
+        None
+    };
 
     let mut ticker = if config.tick_rate_hz > 0 { // Normal tick-based sending
         Some(tokio::time::interval_at(tokio::time::Instant::now() + tick_interval, tick_interval))
@@ -282,35 +363,20 @@ async fn udp_send_loop(
         None
     };
 
+    // Deadline computed once so each tick is a single Instant comparison.
+    let test_deadline = test_start_time + test_duration;
+
     // Only the primary sender respects the full test duration for sending.
-    let loop_duration = if is_primary_sender { test_duration } else { Duration::MAX };
-
-    while Instant::now().duration_since(test_start_time) < loop_duration {
-        if is_primary_sender {
-            if let Some(ref mut t) = ticker { // Normal tick-based
-                t.tick().await;
-            } else { // AFAP mode for primary sender
-                tokio::task::yield_now().await; // Yield to allow other tasks (like receiver) to run
-            }
-        } else { // Non-primary sender logic (e.g., for ACKs or other direction in BiDi)
-            // This part is not typically used in AFAP benchmark mode.
-            // If it were, it would need its own rate control or be event-driven.
-            // For now, assume non-primary senders are not in AFAP mode or this loop isn't hit in that benchmark.
-            if config.tick_rate_hz > 0 { // Ensure tick_interval is valid
-                 tokio::time::sleep(tick_interval).await;
-            } else {
-                // If non-primary and main config is AFAP, this is undefined; yield to be safe.
-                tokio::task::yield_now().await;
-            }
+    while !is_primary_sender || Instant::now() < test_deadline {
+        // Primary and non-primary (other direction in BiDi) senders both pace on the ticker's
+        // absolute schedule; sleeping a full interval after each send would drift by the send time.
+        if let Some(ref mut t) = ticker { // Normal tick-based
+            t.tick().await;
+        } else { // AFAP mode
+            tokio::task::yield_now().await; // Yield to allow other tasks (like receiver) to run
         }
 
-        let current_packet_size = match config.packet_size_range {
-            Some((min_size, max_size)) => {
-                if let Some(ref mut r) = rng { use rand::Rng; r.gen_range(min_size..=max_size) }
-                else { config.packet_size_bytes }
-            }
-            None => config.packet_size_bytes,
-        };
+        let current_packet_size = packet_sizer.next_size();
 
         // let packet_type = if is_primary_sender { // This variable was unused
         //     crate::packet::PacketType::Data
@@ -323,68 +389,219 @@ async fn udp_send_loop(
         // It should probably send DataPacket, not EchoRequest, unless we want bidi RTT from both sides.
         // For now, both primary and secondary UDP senders in bidi mode will send EchoRequest
         // to simplify and allow RTT measurement from both perspectives if desired (though only primary currently processes replies).
-        let packet = CustomPacket::new_echo_request(sequence_number, current_packet_size);
-
-        let sent_payload = packet.to_bytes()?;
-        let send_time = Instant::now();
-        socket.send(&sent_payload).await?;
-
-        metrics.lock().unwrap().record_packet_sent(sent_payload.len());
-
-        // Try to receive EchoReply for RTT - only if this loop is primary sender
-        if is_primary_sender {
-            let mut recv_buf = vec![0u8; 2048]; // Buffer for the reply
-            // Set a timeout for receiving the reply, e.g., 500ms or related to tick_interval
-            // A simple way is to use tokio::time::timeout.
-            // If the main loop is driven by `ticker.tick().await`, waiting here can mess with timing.
-            // This receive should be non-blocking or very short timeout.
-            // For a proper RTT test, the send loop might be simpler: send, try recv with timeout, repeat.
-            // Or, have a separate task for receiving replies.
-
-            // Simplified non-blocking attempt for this pass:
-            // This is not ideal as try_recv is not async.
-            // A better approach: use socket.recv() in a tokio::select! with a timeout.
-            match tokio::time::timeout(Duration::from_millis(200), socket.recv(&mut recv_buf)).await {
-                Ok(Ok(len)) => { // Received something within timeout
-                    let rtt = send_time.elapsed().as_micros();
-                    match CustomPacket::from_bytes(&recv_buf[..len]) {
-                        Ok(reply_packet) => {
-                            if reply_packet.header.packet_type == crate::packet::PacketType::EchoReply &&
-                               reply_packet.header.sequence_number == sequence_number {
-                                metrics.lock().unwrap().record_packet_received(len, rtt);
-                            } else {
-                                // Received unexpected packet or old reply
-                                println!("UDP SendLoop: Received unexpected packet type {:?} or seq {} (expected EchoReply for seq {})",
-                                         reply_packet.header.packet_type, reply_packet.header.sequence_number, sequence_number);
-                            }
-                        }
-                        Err(_e) => { /* Malformed reply */ }
-                    }
-                }
-                Ok(Err(_e)) => { /* Socket error on recv */ }
-                Err(_elapsed) => { /* Timeout waiting for EchoReply */ }
-            }
+        packet.reset_for_send(sequence_number, current_packet_size);
+
+        if datagram.len() == crate::packet::HEADER_LEN + current_packet_size {
+            packet.header.write_to(&mut datagram);
+        } else {
+            datagram.clear();
+            packet.encode_into(&mut datagram);
         }
+        if let Some((pending_replies, _, _)) = &reply_task {
+            // Registered before sending so a fast reply always finds its send time.
+            pending_replies.lock().unwrap().record(sequence_number, Instant::now());
+        }
+        socket.send(&datagram).await?;
+
+        metrics.lock().unwrap().record_packet_sent(datagram.len());
 
         sequence_number = sequence_number.wrapping_add(1);
 
-        if !is_primary_sender && Instant::now().duration_since(test_start_time) >= test_duration {
+        if !is_primary_sender && Instant::now() >= test_deadline {
             // If this is the secondary sender in a bidi test, stop after main duration.
             break;
         }
     }
+    if let Some((_, stop_replies_tx, reply_task)) = reply_task {
+        // Give replies to the last packets the same window as every other packet.
+        tokio::time::sleep(UDP_REPLY_TIMEOUT).await;
+        let _ = stop_replies_tx.send(());
+        let (late_replies, ignored_packets, connection_errors) = reply_task.await.map_err(|e| NetworkError::Other(format!("UDP reply task error: {}", e)))?;
+        if late_replies > 0 || ignored_packets > 0 || connection_errors > 0 {
+            println!("UDP SendLoop to {}: Discarded {} late or unmatched echo replies and {} malformed or non-reply packets; saw {} connection resets (ICMP Port Unreachable?).",
+                     remote_addr, late_replies, ignored_packets, connection_errors);
+        }
+    }
     println!("UDP SendLoop to {}: Finished.", remote_addr);
     Ok(())
 }
 
+/// How long the UDP client waits for an echo reply before the packet counts as unanswered.
+const UDP_REPLY_TIMEOUT: Duration = Duration::from_millis(200);
+
+/// Send times of recent echo requests in a fixed ring indexed by sequence number.
+/// A slot is simply overwritten when the sequence wraps around to it, so lost packets
+/// cost no memory and lookups never hash.
+struct SendTimes {
+    slots: Vec<Option<(u32, Instant)>>,
+}
+
+impl SendTimes {
+    /// Far more packets than can be in flight within UDP_REPLY_TIMEOUT at realistic rates;
+    /// a reply whose slot was already reused is counted as late.
+    const CAPACITY: usize = 1 << 16;
+
+    fn new() -> Self {
+        SendTimes { slots: vec![None; Self::CAPACITY] }
+    }
+
+    fn record(&mut self, sequence_number: u32, sent_at: Instant) {
+        self.slots[sequence_number as usize % Self::CAPACITY] = Some((sequence_number, sent_at));
+    }
+
+    /// Returns the send time for `sequence_number` once; duplicates and stale replies get `None`.
+    fn take(&mut self, sequence_number: u32) -> Option<Instant> {
+        let slot = &mut self.slots[sequence_number as usize % Self::CAPACITY];
+        match *slot {
+            Some((seq, sent_at)) if seq == sequence_number => {
+                *slot = None;
+                Some(sent_at)
+            }
+            _ => None,
+        }
+    }
+}
+
+/// Receives echo replies for `udp_send_loop` and records their RTT until told to stop.
+/// Returns how many replies were late (past UDP_REPLY_TIMEOUT) or matched no pending packet, how
+/// many received packets were not echo replies at all, and how many receives failed with a connection
+/// reset or refusal. These are only counted, never logged per packet. Any other receive error ends the loop.
+async fn udp_reply_loop(
+    socket: Arc<UdpSocket>,
+    pending_replies: Arc<Mutex<SendTimes>>,
+    metrics: Arc<Mutex<TestMetrics>>,
+    mut stop: tokio::sync::oneshot::Receiver<()>,
+) -> (u64, u64, u64) {
+    let mut recv_buf = vec![0u8; MAX_UDP_DATAGRAM_LEN]; // Buffer for echo replies
+    let mut late_replies: u64 = 0;
+    let mut ignored_packets: u64 = 0;
+    let mut connection_errors: u64 = 0;
+
+    loop {
+        tokio::select! {
+            _ = &mut stop => break,
+
+            result = socket.recv(&mut recv_buf) => {
+                let len = match result {
+                    Ok(len) => len,
+                    // ICMP Port Unreachable for an earlier send; each one is a separate event, so this cannot spin.
+                    Err(e) if matches!(e.kind(), io::ErrorKind::ConnectionReset | io::ErrorKind::ConnectionRefused) => {
+                        connection_errors += 1;
+                        continue;
+                    }
+                    Err(e) => {
+                        // Anything else would fail again immediately; stop instead of spinning on it.
+                        eprintln!("UDP ReplyLoop: Error receiving echo replies, no further RTTs will be recorded: {}", e);
+                        break;
+                    }
+                };
+                let received_at = Instant::now();
+                // Only the header is needed to match a reply; the echoed payload is never copied.
+                match PacketHeader::from_bytes(&recv_buf[..len]) {
+                    Ok(reply_header) if reply_header.packet_type == crate::packet::PacketType::EchoReply => {
+                        let sent_at = pending_replies.lock().unwrap().take(reply_header.sequence_number);
+                        match sent_at.map(|t| received_at.duration_since(t)) {
+                            Some(rtt) if rtt <= UDP_REPLY_TIMEOUT => {
+                                metrics.lock().unwrap().record_packet_received(len, rtt.as_micros());
+                            }
+                            _ => late_replies += 1,
+                        }
+                    }
+                    Ok(_) | Err(_) => ignored_packets += 1, // Unexpected packet type or malformed reply
+                }
+            }
+        }
+    }
+    (late_replies, ignored_packets, connection_errors)
+}
+
+/// True if sequence number `a` comes before `b`, using serial-number arithmetic (RFC 1982) so
+/// the order stays correct across u32 wraparound with a single subtraction and sign test.
+fn seq_before(a: u32, b: u32) -> bool {
+    (a.wrapping_sub(b) as i32) < 0
+}
+
+/// Recently received UDP sequence numbers, one bit each, for duplicate detection.
+/// The window slides with the highest sequence number seen, so memory stays fixed for any
+/// test length; numbers that fall behind the window can no longer be checked.
+struct SeenWindow {
+    bits: Vec<u64>,
+    highest: Option<u32>,
+}
+
+impl SeenWindow {
+    const SIZE: u32 = 1 << 16;
+
+    fn new() -> Self {
+        SeenWindow { bits: vec![0; (Self::SIZE / 64) as usize], highest: None }
+    }
+
+    fn slot(sequence_number: u32) -> (usize, u64) {
+        let index = sequence_number % Self::SIZE;
+        ((index / 64) as usize, 1u64 << (index % 64))
+    }
+
+    /// Clears `count` consecutive slots starting at slot index `start`, wrapping at SIZE.
+    /// Whole words are cleared at once, so a large gap after packet loss costs at most SIZE / 64 writes.
+    fn clear_range(&mut self, start: u32, count: u32) {
+        let mut index = start;
+        let mut remaining = count;
+        while remaining > 0 {
+            let bit = index % 64;
+            let run = remaining.min(64 - bit); // SIZE is a multiple of 64, so a run never passes the end
+            let mask = if run == 64 { u64::MAX } else { ((1u64 << run) - 1) << bit };
+            self.bits[(index / 64) as usize] &= !mask;
+            index = (index + run) % Self::SIZE;
+            remaining -= run;
+        }
+    }
+
+    /// Marks `sequence_number` as seen and returns true if it had already been seen.
+    fn check_and_mark(&mut self, sequence_number: u32) -> bool {
+        match self.highest {
+            None => self.highest = Some(sequence_number),
+            Some(highest) => {
+                if seq_before(highest, sequence_number) {
+                    // Sliding forward: forget the slots being reused for the new numbers.
+                    let ahead = sequence_number.wrapping_sub(highest);
+                    if ahead >= Self::SIZE {
+                        self.bits.fill(0);
+                    } else {
+                        self.clear_range(highest.wrapping_add(1) % Self::SIZE, ahead);
+                    }
+                    self.highest = Some(sequence_number);
+                } else if highest.wrapping_sub(sequence_number) >= Self::SIZE {
+                    return false; // Too old to tell
+                }
+            }
+        }
+        let (word, mask) = Self::slot(sequence_number);
+        let seen = self.bits[word] & mask != 0;
+        self.bits[word] |= mask;
+        seen
+    }
+}
+
+/// Most datagrams the UDP receive loop takes from the socket per wakeup. Bounds how long the
+/// bandwidth sampler and shutdown timer can be starved by a busy socket.
+const UDP_RECV_BATCH: usize = 64;
+
 async fn udp_receive_loop(
     config: Arc<TestConfig>,
     socket: Arc<UdpSocket>, // Use an Arc for the socket
     metrics: Arc<Mutex<TestMetrics>>,
 ) -> Result<(), NetworkError> {
-    println!("UDP ReceiveLoop: Listening on {}", socket.local_addr()?);
-    let mut buf = vec![0u8; 4096]; // Increased buffer size
+    let local_addr = socket.local_addr()?; // Looked up once; it is used in every log line below
+    println!("UDP ReceiveLoop: Listening on {}", local_addr);
+    let mut buf = vec![0u8; MAX_UDP_DATAGRAM_LEN]; // Allocated once, reused for every datagram
     let mut highest_udp_seq_received: Option<u32> = None; // For out-of-order detection
+    let mut out_of_order: Vec<(u32, u32)> = Vec::with_capacity(UDP_RECV_BATCH); // (seq, highest seen) per batch
+    let mut seen_window = SeenWindow::new(); // For duplicate detection
+    let mut duplicates: Vec<u32> = Vec::with_capacity(UDP_RECV_BATCH); // Duplicate seqs per batch
+    // Per-datagram problems are counted and reported once at the end rather than printed per datagram.
+    let mut parse_errors: u64 = 0;
+    let mut connection_resets: u64 = 0;
+    let mut reply_send_errors: u64 = 0;
 
     let test_start_time = metrics.lock().unwrap().test_start_time.unwrap_or_else(Instant::now);
     let bandwidth_sample_interval_ms = 1000; // 1 second
@@ -395,13 +612,17 @@ async fn udp_receive_loop(
 
     // Server loop runs for test duration + grace period to catch trailing packets
     let server_lifetime = config.total_duration() + Duration::from_secs(5);
+    // Created once and polled by reference, as in the TCP receive loop: re-creating the timer on
+    // every wakeup registered a new timer entry per batch.
+    let shutdown = tokio::time::sleep_until(tokio::time::Instant::from_std(test_start_time + server_lifetime));
+    tokio::pin!(shutdown);
 
     loop {
         tokio::select! {
             biased;
 
-            _ = tokio::time::sleep_until(tokio::time::Instant::from_std(test_start_time + server_lifetime)) => {
-                println!("UDP ReceiveLoop on {}: Test duration likely ended. Taking final bandwidth sample and shutting down.", socket.local_addr()?);
+            _ = &mut shutdown => {
+                println!("UDP ReceiveLoop on {}: Test duration likely ended. Taking final bandwidth sample and shutting down.", local_addr);
                 if let Ok(mut metrics_guard) = metrics.lock() {
                     if let Some(start_time_instant) = metrics_guard.test_start_time { // Use the stored Instant
                         let current_test_time_ms = Instant::now().duration_since(start_time_instant).as_millis();
@@ -412,63 +633,100 @@ async fn udp_receive_loop(
             }
 
             result = socket.recv_from(&mut buf) => {
-                match result {
-                    Ok((len, src_addr)) => {
-                        let data = &buf[..len];
-                        match CustomPacket::from_bytes(data) {
-                            Ok(packet) => {
-                                let current_seq = packet.header.sequence_number;
-
-                                { // Metrics lock scope
-                                    let mut metrics_guard = metrics.lock().unwrap();
-                                    metrics_guard.record_packet_received(len, 0); // RTT 0 for server-side
-
-                                    if let Some(highest_seen) = highest_udp_seq_received {
-                                        let is_likely_wrap = current_seq < (u32::MAX / 4) && highest_seen > (u32::MAX * 3 / 4);
-                                        if current_seq < highest_seen && !is_likely_wrap {
+                // Handle the datagram that woke us, then drain up to UDP_RECV_BATCH already-queued
+                // ones without awaiting, and apply the whole batch to the metrics under one lock.
+                let mut first_result = Some(result);
+                let mut batch_packets: u64 = 0;
+                let mut batch_bytes: u64 = 0;
+                let mut receive_failed = false;
+                out_of_order.clear();
+                duplicates.clear();
+
+                for _ in 0..UDP_RECV_BATCH {
+                    let result = match first_result.take() {
+                        Some(result) => result,
+                        None => match socket.try_recv_from(&mut buf) {
+                            Err(e) if e.kind() == io::ErrorKind::WouldBlock => break,
+                            other => other,
+                        },
+                    };
+                    match result {
+                        Ok((len, src_addr)) => {
+                            let data = &buf[..len];
+                            // Only the fixed header is decoded; the payload is never copied just to be counted.
+                            match PacketHeader::from_bytes(data) {
+                                Ok(header) => {
+                                    let current_seq = header.sequence_number;
+                                    batch_packets += 1;
+                                    batch_bytes += len as u64;
+
+                                    if seen_window.check_and_mark(current_seq) {
+                                        // Already received; not out of order, but still echoed below.
+                                        duplicates.push(current_seq);
+                                    } else if let Some(highest_seen) = highest_udp_seq_received {
+                                        if seq_before(current_seq, highest_seen) {
                                             // This is an out-of-order packet
-                                            metrics_guard.out_of_order_count += 1;
-                                            let anomaly_time_ms = metrics_guard.test_start_time
-                                                .map_or(0, |st| Instant::now().duration_since(st).as_millis());
-                                            metrics_guard.anomalies.push(crate::anomalies::AnomalyEvent {
-                                                timestamp_ms: anomaly_time_ms,
-                                                anomaly_type: crate::anomalies::AnomalyType::OutOfOrder,
-                                                description: format!("UDP Packet Seq: {} received after {}", current_seq, highest_seen),
-                                            });
+                                            out_of_order.push((current_seq, highest_seen));
                                         }
                                     }
-                                } // Metrics lock scope ends
-
-                                // Always update highest_udp_seq_received to the maximum sequence number seen so far.
-                                highest_udp_seq_received = Some(highest_udp_seq_received.map_or(current_seq, |h| h.max(current_seq)));
-
-                                if packet.header.packet_type == crate::packet::PacketType::EchoRequest {
-                                    let reply_packet = CustomPacket::new_echo_reply(&packet);
-                                    if let Ok(reply_bytes) = reply_packet.to_bytes() {
-                                        if let Err(e) = socket.send_to(&reply_bytes, src_addr).await {
-                                            eprintln!("UDP Server: Error sending echo reply: {}", e);
-                                        } else {
-                                            // metrics.lock().unwrap().record_packet_sent(reply_bytes.len()); // If server ACKs are counted
+
+                                    // Always update highest_udp_seq_received to the latest sequence number seen so far.
+                                    highest_udp_seq_received = match highest_udp_seq_received {
+                                        Some(highest_seen) if seq_before(current_seq, highest_seen) => Some(highest_seen),
+                                        _ => Some(current_seq),
+                                    };
+
+                                    if header.packet_type == crate::packet::PacketType::EchoRequest {
+                                        // The reply is the request with its type byte changed, so it is
+                                        // built in the receive buffer and sent from there.
+                                        let reply_bytes = &mut buf[..len];
+                                        if CustomPacket::encode_echo_reply_in_place(reply_bytes).is_ok() {
+                                            if socket.send_to(reply_bytes, src_addr).await.is_err() {
+                                                reply_send_errors += 1;
+                                            } else {
+                                                // metrics.lock().unwrap().record_packet_sent(reply_bytes.len()); // If server ACKs are counted
+                                            }
                                         }
                                     }
                                 }
+                                Err(_e) => parse_errors += 1,
                             }
-                            Err(e) => eprintln!("UDP ReceiveLoop on {}: Failed to parse CustomPacket from {}: {:?}", socket.local_addr()?, src_addr, e),
                         }
-                    }
-                    Err(e) => {
-                        // Handle specific errors like ConnectionReset which can occur on UDP
-                        if e.kind() == io::ErrorKind::ConnectionReset {
-                            eprintln!("UDP ReceiveLoop on {}: ConnectionReset from a client (ICMP Port Unreachable?)", socket.local_addr()?);
-                            // This is not fatal for a UDP server, continue listening.
-                        } else {
-                            eprintln!("UDP ReceiveLoop on {}: Error receiving data: {}", socket.local_addr()?, e);
-                            // For other errors, you might choose to break or log and continue.
-                            // If the socket is truly broken, this loop might spin. Consider error count limits.
-                            break; // For now, break on other I/O errors.
+                        Err(e) => {
+                            // Handle specific errors like ConnectionReset which can occur on UDP
+                            if e.kind() == io::ErrorKind::ConnectionReset {
+                                // ICMP Port Unreachable from a client. Not fatal for a UDP server, continue listening.
+                                connection_resets += 1;
+                            } else {
+                                eprintln!("UDP ReceiveLoop on {}: Error receiving data: {}", local_addr, e);
+                                // If the socket is truly broken, this loop might spin. Consider error count limits.
+                                receive_failed = true; // For now, stop on other I/O errors.
+                                break;
+                            }
                         }
                     }
                 }
+
+                { // Metrics lock scope: once per batch
+                    let mut metrics_guard = metrics.lock().unwrap();
+                    metrics_guard.record_packets_received_batch(batch_packets, batch_bytes); // No RTT server-side
+                    for &(current_seq, highest_seen) in &out_of_order {
+                        metrics_guard.out_of_order_count += 1;
+                        metrics_guard.record_anomaly(crate::anomalies::AnomalyType::OutOfOrder, || {
+                            format!("UDP Packet Seq: {} received after {}", current_seq, highest_seen)
+                        });
+                    }
+                    for &duplicate_seq in &duplicates {
+                        metrics_guard.duplicate_count += 1;
+                        metrics_guard.record_anomaly(crate::anomalies::AnomalyType::DuplicatePacket, || {
+                            format!("UDP Packet Seq: {} received more than once", duplicate_seq)
+                        });
+                    }
+                } // Metrics lock scope ends
+
+                if receive_failed {
+                    break;
+                }
             }
 
             _ = bandwidth_sampler.tick() => {
@@ -481,16 +739,31 @@ async fn udp_receive_loop(
             }
         }
     }
-    println!("UDP ReceiveLoop on {}: Finished.", socket.local_addr()?);
+    if parse_errors > 0 || connection_resets > 0 || reply_send_errors > 0 {
+        eprintln!("UDP ReceiveLoop on {}: Skipped {} unparseable datagrams, saw {} connection resets (ICMP Port Unreachable?) and failed to send {} echo replies.",
+                  local_addr, parse_errors, connection_resets, reply_send_errors);
+    }
+    println!("UDP ReceiveLoop on {}: Finished.", local_addr);
     Ok(())
 }
 
 
 // --- TCP Stubs (to be fully implemented) ---
+/// Requested kernel send buffer for TCP test connections. A larger buffer lets the sender keep
+/// the link busy across round trips instead of being throttled by a default-sized buffer.
+const TCP_SEND_BUFFER_SIZE: u32 = 4 * 1024 * 1024;
+
 async fn tcp_connect(remote_addr: SocketAddr) -> Result<TcpStream, NetworkError> {
     println!("TCP: Attempting to connect to {}...", remote_addr);
-    match TcpStream::connect(remote_addr).await {
+    let socket = if remote_addr.is_ipv4() { tokio::net::TcpSocket::new_v4()? } else { tokio::net::TcpSocket::new_v6()? };
+    // Best effort: the kernel may clamp or refuse the size; the test still runs with its default.
+    if let Err(e) = socket.set_send_buffer_size(TCP_SEND_BUFFER_SIZE) {
+        eprintln!("TCP: Could not set send buffer size: {}", e);
+    }
+    match socket.connect(remote_addr).await {
         Ok(stream) => {
+            // Each tick's frame must go out when written; Nagle would coalesce ticks into bursts.
+            stream.set_nodelay(true)?;
             println!("TCP: Successfully connected to {}", remote_addr);
             Ok(stream)
         }
@@ -501,9 +774,22 @@ async fn tcp_connect(remote_addr: SocketAddr) -> Result<TcpStream, NetworkError>
     }
 }
 
+/// Requested kernel receive buffer for accepted TCP connections. Set on the listening socket
+/// so accepted sockets inherit it and the window scale is negotiated for it.
+const TCP_RECV_BUFFER_SIZE: u32 = 4 * 1024 * 1024;
+
 async fn tcp_listen(listen_addr: SocketAddr) -> Result<TcpListener, NetworkError> {
     println!("TCP: Attempting to listen on {}...", listen_addr);
-    match TcpListener::bind(listen_addr).await {
+    let socket = if listen_addr.is_ipv4() { tokio::net::TcpSocket::new_v4()? } else { tokio::net::TcpSocket::new_v6()? };
+    // Same as TcpListener::bind: on Unix this only allows rebinding over TIME_WAIT, but on
+    // Windows SO_REUSEADDR would let a second server bind the same port.
+    #[cfg(unix)]
+    socket.set_reuseaddr(true)?;
+    // Best effort, like the client send buffer.
+    if let Err(e) = socket.set_recv_buffer_size(TCP_RECV_BUFFER_SIZE) {
+        eprintln!("TCP: Could not set receive buffer size: {}", e);
+    }
+    match socket.bind(listen_addr).and_then(|_| socket.listen(1024)) {
         Ok(listener) => {
             println!("TCP: Successfully listening on {}", listen_addr);
             Ok(listener)
@@ -515,6 +801,13 @@ async fn tcp_listen(listen_addr: SocketAddr) -> Result<TcpListener, NetworkError
     }
 }
 
+/// Accepts one connection and applies the same per-connection options as `tcp_connect`.
+async fn tcp_accept(listener: &TcpListener) -> Result<(TcpStream, SocketAddr), NetworkError> {
+    let (stream, client_addr) = listener.accept().await?;
+    stream.set_nodelay(true)?; // Replies and secondary-direction frames must not wait on Nagle
+    Ok((stream, client_addr))
+}
+
 async fn tcp_send_loop(
     config: Arc<TestConfig>,
     mut writer: tokio::io::WriteHalf<TcpStream>, // Changed to WriteHalf
@@ -530,48 +823,46 @@ async fn tcp_send_loop(
     let test_start_time = metrics.lock().unwrap().test_start_time.unwrap_or_else(Instant::now);
     let test_duration = config.total_duration();
     let tick_interval = config.tick_interval();
-    // use rand::rngs::StdRng; // Already imported if udp_send_loop is in the same file and parsed first
-    // use rand::SeedableRng;
-    let mut rng = if config.packet_size_range.is_some() { Some(rand::rngs::StdRng::from_entropy()) } else { None };
+    let mut packet_sizer = PacketSizer::new(&config);
     let mut sequence_number: u32 = 0;
+    // One packet is reused for the whole test; only its header and payload length change per tick.
+    let mut packet = CustomPacket::new_data_packet(sequence_number, config.packet_size_bytes);
+    // Length prefix and packet are assembled into one reused buffer and written with a single call.
+    let max_packet_size = PacketSizer::max_size(&config);
+    let mut frame: Vec<u8> = Vec::with_capacity(4 + crate::packet::HEADER_LEN + max_packet_size);
     let mut ticker = tokio::time::interval_at(tokio::time::Instant::now() + tick_interval, tick_interval);
 
-    let loop_duration = if is_primary_sender { test_duration } else { Duration::MAX };
+    let test_deadline = test_start_time + test_duration; // Computed once, compared per tick
 
-    while Instant::now().duration_since(test_start_time) < loop_duration {
-         if is_primary_sender {
-            ticker.tick().await;
-        } else {
-            // Non-primary senders in TCP bidi might be event-driven (e.g. ACKs)
-            // or could also send data not strictly tied to the main tickrate.
-            // For now, let's assume it might also send data periodically if not primary.
-            // If this loop is ONLY for ACKs, it would look very different (event-driven).
-            tokio::time::sleep(tick_interval).await;
-        }
+    while !is_primary_sender || Instant::now() < test_deadline {
+        // Non-primary senders in TCP bidi could later become event-driven (e.g. ACKs); for now
+        // they send data on the same absolute tick schedule as the primary, without drift.
+        ticker.tick().await;
 
-        let current_packet_size = match config.packet_size_range {
-            Some((min_size, max_size)) => {
-                if let Some(ref mut r) = rng { use rand::Rng; r.gen_range(min_size..=max_size) }
-                else { config.packet_size_bytes }
-            }
-            None => config.packet_size_bytes,
-        };
+        let current_packet_size = packet_sizer.next_size();
 
         // TODO: Define packet type more meaningfully if not primary_sender (e.g. Ack, EchoReply)
-        let packet = CustomPacket::new_data_packet(sequence_number, current_packet_size);
-        let data = packet.to_bytes()?;
-
-        // Frame the packet: send length (u32) then data
-        let len_bytes = (data.len() as u32).to_be_bytes();
+        packet.reset_for_send(sequence_number, current_packet_size);
+
+        // Frame the packet: length (u32) then data
+        let data_len = crate::packet::HEADER_LEN + current_packet_size;
+        if frame.len() == 4 + data_len {
+            // Same size as the previous frame and the payload is always zero-filled,
+            // so only the header fields need rewriting.
+            packet.header.write_to(&mut frame[4..]);
+        } else {
+            frame.clear();
+            frame.extend_from_slice(&(data_len as u32).to_be_bytes());
+            packet.encode_into(&mut frame);
+        }
 
-        writer.write_all(&len_bytes).await.map_err(|e| NetworkError::IoError(e))?;
-        writer.write_all(&data).await.map_err(|e| NetworkError::IoError(e))?;
+        writer.write_all(&frame).await.map_err(|e| NetworkError::IoError(e))?;
         // Consider writer.flush().await? if timely delivery is critical and Nagle might be an issue.
 
-        metrics.lock().unwrap().record_packet_sent(data.len() + 4); // +4 for length prefix
+        metrics.lock().unwrap().record_packet_sent(frame.len()); // includes the 4-byte length prefix
         sequence_number = sequence_number.wrapping_add(1);
 
-        if !is_primary_sender && Instant::now().duration_since(test_start_time) >= test_duration {
+        if !is_primary_sender && Instant::now() >= test_deadline {
             // If this is the secondary sender in a bidi test, stop after main duration.
             break;
         }
@@ -584,9 +875,39 @@ async fn tcp_send_loop(
     Ok(())
 }
 
+/// Largest TCP frame (excluding the 4-byte length prefix) the receive loop will accept.
+const MAX_TCP_FRAME_LEN: usize = 10 * 1024 * 1024;
+/// Capacity of the buffered reader wrapped around the TCP read half.
+const TCP_READ_BUFFER_SIZE: usize = 64 * 1024;
+
+/// Received TCP counts not yet added to the shared metrics. Dropping it flushes them, so the
+/// last partial sampling interval is kept even when the receive loop's future is cancelled,
+/// e.g. by `try_join!` after the paired send loop fails.
+struct PendingReceived {
+    metrics: Arc<Mutex<TestMetrics>>,
+    packets: u64,
+    bytes: u64,
+}
+
+impl PendingReceived {
+    fn flush_into(&mut self, metrics: &mut TestMetrics) {
+        metrics.record_packets_received_batch(std::mem::take(&mut self.packets), std::mem::take(&mut self.bytes));
+    }
+}
+
+impl Drop for PendingReceived {
+    fn drop(&mut self) {
+        if self.packets > 0 {
+            if let Ok(mut metrics_guard) = self.metrics.lock() {
+                metrics_guard.record_packets_received_batch(self.packets, self.bytes);
+            }
+        }
+    }
+}
+
 async fn tcp_receive_loop(
     config: Arc<TestConfig>,
-    mut reader: tokio::io::ReadHalf<TcpStream>, // Changed to ReadHalf
+    reader: tokio::io::ReadHalf<TcpStream>, // Changed to ReadHalf
     metrics: Arc<Mutex<TestMetrics>>,
 ) -> Result<(), NetworkError> {
     println!("TCP ReceiveLoop: Started.");
@@ -614,16 +935,34 @@ async fn tcp_receive_loop(
     // tokio::time::sleep(config.total_duration() + Duration::from_secs(5)).await; // Grace period for receiver
     // This sleep was part of the placeholder, the actual loop is below.
 
+    // Buffer the socket so the length prefix and packet of many small frames are served
+    // from one read syscall instead of two syscalls per frame.
+    let mut reader = tokio::io::BufReader::with_capacity(TCP_READ_BUFFER_SIZE, reader);
     let mut length_buffer = [0u8; 4]; // To read the u32 length prefix
-    let mut packet_buffer = Vec::with_capacity(config.packet_size_bytes.max(1024) * 2); // Initial capacity
+    // Per-frame problems are counted and reported once at the end rather than printed per frame.
+    let mut zero_length_frames: u64 = 0;
+    let mut parse_errors: u64 = 0;
+    // Read target for packet data. Sized up front and only ever grown, so steady-state reads
+    // go straight into existing memory with no reallocation or re-zeroing.
+    let max_packet_size = PacketSizer::max_size(&config);
+    let mut packet_buffer = vec![0u8; (crate::packet::HEADER_LEN + max_packet_size).max(1024)];
+    // Received counts are accumulated here and flushed to the shared metrics on each bandwidth
+    // sample and at exit, rather than taking the metrics lock for every frame.
+    let mut pending = PendingReceived { metrics: Arc::clone(&metrics), packets: 0, bytes: 0 };
+    let mut first_packet_recorded = false;
+    let mut loop_result = Ok(());
+    // Created once and polled by reference; the deadline does not change between iterations.
+    let shutdown = tokio::time::sleep_until(tokio::time::Instant::from_std(test_start_time + server_lifetime));
+    tokio::pin!(shutdown);
 
     loop {
         tokio::select! {
             biased; // Prioritize packet reading over sampling or timeout
 
-            _ = tokio::time::sleep_until(tokio::time::Instant::from_std(test_start_time + server_lifetime)) => {
+            _ = &mut shutdown => {
                 println!("TCP ReceiveLoop: Test duration likely ended.");
                  if let Ok(mut metrics_guard) = metrics.lock() {
+                    pending.flush_into(&mut metrics_guard);
                     if let Some(start_time_instant) = metrics_guard.test_start_time {
                         let current_test_time_ms = Instant::now().duration_since(start_time_instant).as_millis();
                         metrics_guard.take_bandwidth_sample(current_test_time_ms);
@@ -639,39 +978,40 @@ async fn tcp_receive_loop(
                         let packet_len = u32::from_be_bytes(length_buffer) as usize;
 
                         if packet_len == 0 { // Could be a keep-alive or shutdown signal
-                            println!("TCP ReceiveLoop: Received 0-length packet, possibly EOF or keep-alive.");
+                            zero_length_frames += 1;
                             continue; // Or break, depending on protocol for 0-len
                         }
-                        if packet_len > packet_buffer.capacity() { // Basic sanity check for length
-                             if packet_len > 10 * 1024 * 1024 { // e.g. 10MB limit
-                                eprintln!("TCP ReceiveLoop: Excessive packet length received: {}, closing connection.", packet_len);
-                                return Err(NetworkError::SerializationError("Excessive packet length".to_string()));
-                            }
-                            packet_buffer.reserve(packet_len); // Grow buffer if needed
+                        if packet_len > MAX_TCP_FRAME_LEN { // Basic sanity check for length
+                            eprintln!("TCP ReceiveLoop: Excessive packet length received: {}, closing connection.", packet_len);
+                            loop_result = Err(NetworkError::SerializationError("Excessive packet length".to_string()));
+                            break;
                         }
-                        // Ensure buffer is correctly sized for the read_exact operation
-                        // This is slightly inefficient if packet_len is much smaller than current vec len.
-                        // Using VecDeque or a more managed buffer could be better.
-                        // For now, simple resize.
                         if packet_buffer.len() < packet_len {
-                           packet_buffer.resize(packet_len, 0);
+                            packet_buffer.resize(packet_len, 0); // Grow only; never shrinks
                         }
 
 
                         // 2. Read packet data
                         match reader.read_exact(&mut packet_buffer[..packet_len]).await {
                             Ok(_) => {
-                                match CustomPacket::from_bytes(&packet_buffer[..packet_len]) {
-                                    Ok(_packet) => { // Prefixed with _ as it's not used beyond parsing
+                                // Only the header is validated; decoding the full packet would copy the
+                                // payload just to throw it away. Wire size is already known from the frame.
+                                match PacketHeader::from_bytes(&packet_buffer[..packet_len]) {
+                                    Ok(_header) => { // Prefixed with _ as it's not used beyond parsing
                                         // TODO: Process packet (e.g., if it's an EchoRequest, need WriteHalf to reply)
                                         // This loop currently only has ReadHalf. Echo replies would need more complex setup.
                                         // For now, just record metrics.
-                                        let rtt_micros = 0; // Server-side receive, RTT measured by client.
-                                                          // If this is client receiving echo, then RTT is calculated here.
-                                        metrics.lock().unwrap().record_packet_received(packet_len + 4, rtt_micros);
+                                        // Server-side receive: no RTT here, it is measured by the client.
+                                        pending.packets += 1;
+                                        pending.bytes += (packet_len + 4) as u64;
+                                        if !first_packet_recorded {
+                                            // Flush the first frame right away so the test start time is set on arrival.
+                                            pending.flush_into(&mut metrics.lock().unwrap());
+                                            first_packet_recorded = true;
+                                        }
                                     }
-                                    Err(e) => {
-                                        eprintln!("TCP ReceiveLoop: Failed to parse CustomPacket: {:?}", e);
+                                    Err(_) => {
+                                        parse_errors += 1;
                                         // Potentially log anomaly
                                     }
                                 }
@@ -682,7 +1022,8 @@ async fn tcp_receive_loop(
                             }
                             Err(e) => {
                                 eprintln!("TCP ReceiveLoop: Error reading packet data: {}", e);
-                                return Err(NetworkError::IoError(e)); // Return error
+                                loop_result = Err(NetworkError::IoError(e));
+                                break;
                             }
                         }
                     }
@@ -692,13 +1033,15 @@ async fn tcp_receive_loop(
                     }
                     Err(e) => {
                         eprintln!("TCP ReceiveLoop: Error reading packet length: {}", e);
-                        return Err(NetworkError::IoError(e)); // Return error
+                        loop_result = Err(NetworkError::IoError(e));
+                        break;
                     }
                 }
             }
 
             _ = bandwidth_sampler.tick() => {
                 if let Ok(mut metrics_guard) = metrics.lock() {
+                    pending.flush_into(&mut metrics_guard);
                     if let Some(start_time_instant) = metrics_guard.test_start_time {
                         let current_test_time_ms = Instant::now().duration_since(start_time_instant).as_millis();
                         metrics_guard.take_bandwidth_sample(current_test_time_ms);
@@ -708,6 +1051,138 @@ async fn tcp_receive_loop(
         }
     }
 
+    // Counts from the last partial sampling interval (e.g. when the peer closed the connection).
+    drop(pending);
+
+    if zero_length_frames > 0 || parse_errors > 0 {
+        eprintln!("TCP ReceiveLoop: Skipped {} zero-length frames and {} unparseable packets.", zero_length_frames, parse_errors);
+    }
     println!("TCP ReceiveLoop: Finished.");
-    Ok(())
+    loop_result
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_send_times_take_returns_send_time_once() {
+        let mut send_times = SendTimes::new();
+        let sent_at = Instant::now();
+        send_times.record(7, sent_at);
+
+        assert_eq!(send_times.take(7), Some(sent_at));
+        // A duplicated echo reply for the same sequence number finds nothing
+        assert_eq!(send_times.take(7), None);
+    }
+
+    #[test]
+    fn test_send_times_take_after_slot_reused() {
+        let mut send_times = SendTimes::new();
+        let first_sent_at = Instant::now();
+        let reused_sent_at = first_sent_at + Duration::from_millis(1);
+        let reused_seq = 7 + SendTimes::CAPACITY as u32;
+        send_times.record(7, first_sent_at);
+        send_times.record(reused_seq, reused_sent_at); // Same slot
+
+        assert_eq!(send_times.take(7), None, "a reply whose slot was reused must not match");
+        assert_eq!(send_times.take(reused_seq), Some(reused_sent_at));
+    }
+
+    #[test]
+    fn test_pending_received_flushes_on_drop() {
+        let metrics = Arc::new(Mutex::new(TestMetrics::default()));
+        let mut pending = PendingReceived { metrics: Arc::clone(&metrics), packets: 2, bytes: 200 };
+        pending.flush_into(&mut metrics.lock().unwrap());
+        pending.packets += 1;
+        pending.bytes += 50;
+        drop(pending); // As when the receive future is cancelled mid-interval
+
+        let metrics = metrics.lock().unwrap();
+        assert_eq!(metrics.packets_received, 3);
+        assert_eq!(metrics.bytes_received, 250);
+    }
+
+    #[test]
+    fn test_seq_before() {
+        let half = 1u32 << 31;
+        let cases = [
+            (1, 2, true),
+            (2, 1, false),
+            (5, 5, false),
+            (u32::MAX, 0, true), // Across the wrap
+            (0, u32::MAX, false),
+            (0, half - 1, true), // Largest forward distance
+            (0, half + 1, false), // One step further reads as behind
+            // Exactly half way is ambiguous in serial-number arithmetic: both orders read as "before"
+            (0, half, true),
+            (half, 0, true),
+        ];
+        for (a, b, expected) in cases {
+            assert_eq!(seq_before(a, b), expected, "seq_before({}, {})", a, b);
+        }
+    }
+
+    #[test]
+    fn test_seen_window_detects_duplicates_within_window() {
+        let mut window = SeenWindow::new();
+        assert!(!window.check_and_mark(10));
+        assert!(!window.check_and_mark(11));
+        assert!(window.check_and_mark(10));
+        // Reordered but not yet seen, still inside the window
+        assert!(!window.check_and_mark(5));
+        assert!(window.check_and_mark(5));
+    }
+
+    #[test]
+    fn test_seen_window_jump_of_size_or_more_clears_window() {
+        let mut window = SeenWindow::new();
+        for seq in 0..10 {
+            window.check_and_mark(seq);
+        }
+        let jumped_to = 2 * SeenWindow::SIZE + 5;
+        assert!(!window.check_and_mark(jumped_to));
+        // Shares a slot with 3, which was marked before the jump
+        assert!(!window.check_and_mark(jumped_to - 2));
+        assert!(window.check_and_mark(jumped_to - 2));
+    }
+
+    #[test]
+    fn test_seen_window_packet_older_than_window_is_not_a_duplicate() {
+        let mut window = SeenWindow::new();
+        assert!(!window.check_and_mark(5));
+        assert!(!window.check_and_mark(SeenWindow::SIZE + 10));
+        // 5 was seen, but it is now more than SIZE behind and can no longer be checked
+        assert!(!window.check_and_mark(5));
+        assert!(!window.check_and_mark(5));
+    }
+
+    #[test]
+    fn test_seen_window_clear_range_clears_exactly_the_span() {
+        let size = SeenWindow::SIZE;
+        for (start, count) in [(5, 1), (0, 64), (3, 200), (60, 10), (size - 10, 30), (1, size - 1)] {
+            let mut window = SeenWindow::new();
+            window.bits.fill(u64::MAX);
+            window.clear_range(start, count);
+            for index in 0..size {
+                let (word, mask) = SeenWindow::slot(index);
+                let cleared = (index + size - start) % size < count;
+                assert_eq!(window.bits[word] & mask == 0, cleared, "start {}, count {}, slot {}", start, count, index);
+            }
+        }
+    }
+
+    #[test]
+    fn test_seen_window_across_wraparound() {
+        let mut window = SeenWindow::new();
+        for seq in [u32::MAX - 1, u32::MAX, 0, 1] {
+            assert!(!window.check_and_mark(seq));
+        }
+        assert!(window.check_and_mark(u32::MAX));
+        assert!(window.check_and_mark(0));
+        assert!(!window.check_and_mark(2));
+        // A number behind the wrapped highest is old, not far ahead
+        assert!(!window.check_and_mark(u32::MAX - 2));
+        assert!(window.check_and_mark(u32::MAX - 2));
+    }
 }
@@ -2,12 +2,13 @@
 use serde::{Serialize, Deserialize};
 use std::time::{SystemTime, UNIX_EPOCH};
 
-// Using bincode for serialization/deserialization for efficiency.
-// If text-based is needed for some reason, could switch to JSON.
+// CustomPacket uses a fixed binary header (see HEADER_LEN) followed by the raw payload.
+// The payload length is implicit: it is whatever follows the header in the datagram or TCP frame.
 
 /// Represents the different types of packets that can be sent.
 /// This helps the receiver understand how to interpret the payload.
 #[derive(Serialize, Deserialize, Debug, Clone, Copy, PartialEq, Eq)]
+#[repr(u8)]
 pub enum PacketType {
     Data,         // Standard data packet for bandwidth/latency tests
     Ack,          // Acknowledgement packet
@@ -16,9 +17,25 @@ pub enum PacketType {
     EchoReply,    // Reply to an EchoRequest
 }
 
+impl PacketType {
+    fn from_u8(value: u8) -> Option<Self> {
+        match value {
+            0 => Some(PacketType::Data),
+            1 => Some(PacketType::Ack),
+            2 => Some(PacketType::Control),
+            3 => Some(PacketType::EchoRequest),
+            4 => Some(PacketType::EchoReply),
+            _ => None,
+        }
+    }
+}
+
+/// Size of the encoded header: sequence number (u32 BE), timestamp (u64 BE), packet type (u8).
+pub const HEADER_LEN: usize = 4 + 8 + 1;
+
 /// The header part of our custom packet.
 /// Contains metadata for sequencing, timing, and type identification.
-#[derive(Serialize, Deserialize, Debug, Clone)]
+#[derive(Serialize, Deserialize, Debug, Clone, Copy)]
 pub struct PacketHeader {
     pub sequence_number: u32,
     pub timestamp_ms: u64,    // Sender's timestamp in milliseconds since a common epoch (e.g., test start or Unix epoch)
@@ -27,27 +44,64 @@ pub struct PacketHeader {
     // pub integrity_checksum: u32, // Optional: For payload integrity if not relying solely on UDP/TCP checksums
 }
 
+/// Current wall-clock time in milliseconds since the Unix epoch, as stored in PacketHeader.
+fn current_timestamp_ms() -> u64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .expect("Time went backwards")
+        .as_millis() as u64
+}
+
 impl PacketHeader {
     pub fn new(sequence_number: u32, packet_type: PacketType) -> Self {
         PacketHeader {
             sequence_number,
-            timestamp_ms: SystemTime::now()
-                .duration_since(UNIX_EPOCH)
-                .expect("Time went backwards")
-                .as_millis() as u64,
+            timestamp_ms: current_timestamp_ms(),
             packet_type,
         }
     }
+
+    /// Writes the encoded header into the first `HEADER_LEN` bytes of `buf`.
+    /// Lets a sender refresh the header of an already-encoded packet in place.
+    pub fn write_to(&self, buf: &mut [u8]) {
+        buf[0..4].copy_from_slice(&self.sequence_number.to_be_bytes());
+        buf[4..12].copy_from_slice(&self.timestamp_ms.to_be_bytes());
+        buf[12] = self.packet_type as u8;
+    }
+
+    /// Decodes only the header of an encoded packet, leaving the payload untouched.
+    /// Receivers that just need sequence/type/timestamp can skip copying the payload.
+    pub fn from_bytes(data: &[u8]) -> Result<Self, &'static str> {
+        if data.len() < HEADER_LEN {
+            return Err("Packet too short for header");
+        }
+        Ok(PacketHeader {
+            sequence_number: u32::from_be_bytes(data[0..4].try_into().unwrap()),
+            timestamp_ms: u64::from_be_bytes(data[4..12].try_into().unwrap()),
+            packet_type: PacketType::from_u8(data[12]).ok_or("Unknown packet type")?,
+        })
+    }
 }
 
 /// The full packet structure including header and payload.
 /// The payload is generic to allow different types of data.
-#[derive(Serialize, Deserialize, Debug, Clone)]
+#[derive(Serialize, Deserialize, Clone)]
 pub struct CustomPacket {
     pub header: PacketHeader,
     pub payload: Vec<u8>, // The actual data being sent
 }
 
+// Debug shows the payload length, not its bytes: the derived impl would format every
+// payload byte, which turns a debug print of a large packet into a multi-KB string.
+impl std::fmt::Debug for CustomPacket {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        f.debug_struct("CustomPacket")
+            .field("header", &self.header)
+            .field("payload_len", &self.payload.len())
+            .finish()
+    }
+}
+
 impl CustomPacket {
     /// Creates a new data packet with the given sequence number and payload.
     pub fn new_data_packet(sequence_number: u32, payload_size_bytes: usize) -> Self {
@@ -69,22 +123,55 @@ impl CustomPacket {
     pub fn new_echo_reply(request_packet: &CustomPacket) -> Self {
         CustomPacket {
             header: PacketHeader { // Keep original sequence and timestamp for RTT calculation
-                sequence_number: request_packet.header.sequence_number,
-                timestamp_ms: request_packet.header.timestamp_ms,
                 packet_type: PacketType::EchoReply,
+                ..request_packet.header
             },
             payload: request_packet.payload.clone(), // Echo the payload
         }
     }
 
-    /// Serializes the packet into a byte vector using bincode.
-    pub fn to_bytes(&self) -> Result<Vec<u8>, bincode::Error> {
-        bincode::serialize(self)
+    /// Turns an encoded echo request into its encoded echo reply in place.
+    /// Produces the same bytes as `new_echo_reply(..).to_bytes()`: only the type byte differs,
+    /// so a server can echo straight from its receive buffer without decoding or copying.
+    pub fn encode_echo_reply_in_place(encoded_request: &mut [u8]) -> Result<(), &'static str> {
+        if encoded_request.len() < HEADER_LEN {
+            return Err("Packet too short for header");
+        }
+        encoded_request[12] = PacketType::EchoReply as u8;
+        Ok(())
+    }
+
+    /// Prepares this packet to be sent again with a new sequence number.
+    /// Refreshes the timestamp and resizes the zero-filled payload in place, so send loops
+    /// can keep one packet around instead of allocating a new one every tick.
+    pub fn reset_for_send(&mut self, sequence_number: u32, payload_size_bytes: usize) {
+        self.header.sequence_number = sequence_number;
+        self.header.timestamp_ms = current_timestamp_ms();
+        self.payload.resize(payload_size_bytes, 0);
+    }
+
+    /// Serializes the packet: fixed-size header followed by the payload.
+    pub fn to_bytes(&self) -> Vec<u8> {
+        let mut bytes = Vec::with_capacity(HEADER_LEN + self.payload.len());
+        self.encode_into(&mut bytes);
+        bytes
+    }
+
+    /// Appends the encoded packet to `buf`, so callers can reuse one buffer across sends.
+    pub fn encode_into(&self, buf: &mut Vec<u8>) {
+        let header_start = buf.len();
+        buf.resize(header_start + HEADER_LEN, 0);
+        self.header.write_to(&mut buf[header_start..]);
+        buf.extend_from_slice(&self.payload);
     }
 
-    /// Deserializes a byte slice into a Packet structure using bincode.
-    pub fn from_bytes(bytes: &[u8]) -> Result<Self, bincode::Error> {
-        bincode::deserialize(bytes)
+    /// Deserializes a byte slice produced by `to_bytes`.
+    pub fn from_bytes(data: &[u8]) -> Result<Self, &'static str> {
+        let header = PacketHeader::from_bytes(data)?;
+        Ok(CustomPacket {
+            header,
+            payload: data[HEADER_LEN..].to_vec(),
+        })
     }
 }
 
@@ -147,10 +234,11 @@ mod tests {
     }
 
     #[test]
-    fn test_custom_packet_serialization_deserialization_bincode() {
+    fn test_custom_packet_serialization_deserialization() {
         let packet = CustomPacket::new_data_packet(1001, 64);
 
-        let bytes = packet.to_bytes().expect("Serialization failed");
+        let bytes = packet.to_bytes();
+        assert_eq!(bytes.len(), HEADER_LEN + 64);
         let deserialized_packet = CustomPacket::from_bytes(&bytes).expect("Deserialization failed");
 
         assert_eq!(packet.header.sequence_number, deserialized_packet.header.sequence_number);
@@ -165,7 +253,7 @@ mod tests {
         let echo_req = CustomPacket::new_echo_request(1002, 32);
         let echo_reply = CustomPacket::new_echo_reply(&echo_req);
 
-        let reply_bytes = echo_reply.to_bytes().unwrap();
+        let reply_bytes = echo_reply.to_bytes();
         let deserialized_reply = CustomPacket::from_bytes(&reply_bytes).unwrap();
 
         assert_eq!(echo_reply.header.sequence_number, deserialized_reply.header.sequence_number);
@@ -174,9 +262,76 @@ mod tests {
         assert_eq!(echo_reply.payload, deserialized_reply.payload);
     }
 
+    #[test]
+    fn test_custom_packet_reset_for_send() {
+        let mut packet = CustomPacket::new_data_packet(1, 64);
+        packet.reset_for_send(2, 16);
+        assert_eq!(packet.header.sequence_number, 2);
+        assert_eq!(packet.header.packet_type, PacketType::Data);
+        assert_eq!(packet.payload, vec![0u8; 16]);
+
+        packet.reset_for_send(3, 128);
+        assert_eq!(packet.header.sequence_number, 3);
+        assert_eq!(packet.payload, vec![0u8; 128]);
+    }
+
     #[test]
     fn test_short_packet_from_bytes() {
         let short_data = vec![1,2,3];
         assert!(DataPacket::from_bytes(&short_data).is_err());
+        assert!(CustomPacket::from_bytes(&short_data).is_err());
+    }
+
+    #[test]
+    fn test_custom_packet_encode_into_appends() {
+        let packet = CustomPacket::new_data_packet(7, 4);
+        let mut buf = vec![0xAA, 0xBB];
+        packet.encode_into(&mut buf);
+        assert_eq!(&buf[..2], &[0xAA, 0xBB]);
+        assert_eq!(&buf[2..], packet.to_bytes().as_slice());
+    }
+
+    #[test]
+    fn test_encode_echo_reply_in_place() {
+        let request = CustomPacket::new_echo_request(9, 16);
+        let mut bytes = request.to_bytes();
+        CustomPacket::encode_echo_reply_in_place(&mut bytes).unwrap();
+        assert_eq!(bytes, CustomPacket::new_echo_reply(&request).to_bytes());
+        assert!(CustomPacket::encode_echo_reply_in_place(&mut [0u8; 4]).is_err());
+    }
+
+    #[test]
+    fn test_packet_header_write_to_patches_in_place() {
+        let mut packet = CustomPacket::new_data_packet(1, 8);
+        let mut bytes = packet.to_bytes();
+        packet.reset_for_send(2, 8);
+        packet.header.write_to(&mut bytes);
+        assert_eq!(bytes, packet.to_bytes());
+    }
+
+    #[test]
+    fn test_packet_header_from_bytes() {
+        let packet = CustomPacket::new_echo_request(42, 100);
+        let bytes = packet.to_bytes();
+        let header = PacketHeader::from_bytes(&bytes).unwrap();
+        assert_eq!(header.sequence_number, 42);
+        assert_eq!(header.timestamp_ms, packet.header.timestamp_ms);
+        assert_eq!(header.packet_type, PacketType::EchoRequest);
+        assert!(PacketHeader::from_bytes(&bytes[..HEADER_LEN - 1]).is_err());
+    }
+
+    #[test]
+    fn test_custom_packet_debug_omits_payload_bytes() {
+        let packet = CustomPacket::new_data_packet(5, 4096);
+        let debug = format!("{:?}", packet);
+        assert!(debug.contains("payload_len: 4096"));
+        assert!(debug.len() < 200);
+    }
+
+    #[test]
+    fn test_custom_packet_unknown_type() {
+        let mut bytes = CustomPacket::new_data_packet(1, 8).to_bytes();
+        bytes[12] = 0xFF;
+        assert!(CustomPacket::from_bytes(&bytes).is_err());
     }
 }
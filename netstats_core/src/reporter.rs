@@ -5,7 +5,7 @@ use crate::anomalies::AnomalyEvent;
 use crate::config::TestConfig; // Protocol, TestMode, TcpBidirectionalMode were unused directly by this file's code
 use std::time::SystemTime;
 use askama::Template; // Import Askama
-use serde_json; // For serializing data to JSON for JS charts - used by macro serde_json::json!
+use serde_json; // For serializing data to JSON for JS charts
 
 #[derive(Template)]
 #[template(path = "report_template.html")] // Path to the template file
@@ -31,10 +31,11 @@ pub struct TestSummary {
 /// Processes raw bandwidth samples from TestMetrics into a Vec<(f64, f64)>
 /// representing (time_seconds_since_start, megabits_per_second).
 fn process_bandwidth_samples(metrics: &TestMetrics) -> Vec<(f64, f64)> {
-    let mut processed_samples = Vec::new();
     if metrics.bandwidth_samples.is_empty() {
-        return processed_samples;
+        return Vec::new();
     }
+    // At most one output point per raw sample.
+    let mut processed_samples = Vec::with_capacity(metrics.bandwidth_samples.len());
 
     // The first timestamp in bandwidth_samples is the time of the end of the first interval.
     // The bytes are for that interval.
@@ -43,35 +44,25 @@ fn process_bandwidth_samples(metrics: &TestMetrics) -> Vec<(f64, f64)> {
     // Sample 2: from 1000ms to 2000ms, 130000 bytes. Interval duration = 1000ms. Mbps = (130000*8)/(1000/1000)/1_000_000
 
     let mut last_sample_time_ms = 0;
+    // Bytes from a zero-length interval (several samples in the same millisecond)
+    // are carried into the next interval instead of being dropped or logged per sample.
+    let mut carried_bytes: u64 = 0;
 
-    for (sample_end_time_ms, bytes_in_interval) in &metrics.bandwidth_samples {
+    for &(sample_end_time_ms, bytes_in_interval) in &metrics.bandwidth_samples {
         let interval_duration_ms = sample_end_time_ms.saturating_sub(last_sample_time_ms);
+        carried_bytes += bytes_in_interval;
         if interval_duration_ms == 0 {
-            // Avoid division by zero if multiple samples at the same millisecond,
-            // or if the first sample is at 0ms (though current logic makes it end_time).
-            // If bytes > 0, this is infinite bandwidth, which is unlikely/error.
-            // If bytes = 0, it's 0 mbps.
-            if *bytes_in_interval > 0 {
-                 // Log or handle this case - potentially very high or infinite bps
-                 // For now, skip if duration is zero and bytes > 0 to avoid skewed graph
-                eprintln!("Warning: Zero duration interval with {} bytes at {}ms", bytes_in_interval, sample_end_time_ms);
-                // Or assign a very high value, or average with next if possible.
-            }
-            // if *bytes_in_interval == 0, then 0 mbps is fine.
-            // processed_samples.push((*sample_end_time_ms as f64 / 1000.0, 0.0));
-            // Let's just update last_sample_time_ms and continue, the bytes will add to next interval.
-            // This shouldn't happen often with current sampling logic.
-            last_sample_time_ms = *sample_end_time_ms;
             continue;
         }
 
         let interval_duration_secs = interval_duration_ms as f64 / 1000.0;
-        let megabits_per_second = (*bytes_in_interval as f64 * 8.0) / interval_duration_secs / 1_000_000.0;
+        let megabits_per_second = (carried_bytes as f64 * 8.0) / interval_duration_secs / 1_000_000.0;
 
         // The timestamp for the graph point should represent the end of the interval
-        processed_samples.push((*sample_end_time_ms as f64 / 1000.0, megabits_per_second));
+        processed_samples.push((sample_end_time_ms as f64 / 1000.0, megabits_per_second));
 
-        last_sample_time_ms = *sample_end_time_ms;
+        last_sample_time_ms = sample_end_time_ms;
+        carried_bytes = 0;
     }
 
     processed_samples
@@ -80,7 +71,7 @@ fn process_bandwidth_samples(metrics: &TestMetrics) -> Vec<(f64, f64)> {
 
 pub fn generate_summary(
     config: &TestConfig,
-    metrics: TestMetrics, // metrics itself contains the anomalies
+    mut metrics: TestMetrics, // metrics itself contains the anomalies
     actual_duration: std::time::Duration,
 ) -> TestSummary {
     // For now, using simple string representation of time.
@@ -90,12 +81,15 @@ pub fn generate_summary(
     };
 
     let processed_bandwidth = process_bandwidth_samples(&metrics);
-    let anomalies_cloned = metrics.anomalies.clone(); // Clone before metrics is moved
+    // Move the anomaly list out instead of cloning it: the report only reads
+    // TestSummary.anomalies, so keeping a second copy (with every description
+    // String duplicated) inside overall_metrics is wasted work for long tests.
+    let anomalies = std::mem::take(&mut metrics.anomalies);
 
     TestSummary {
         test_config: config.clone(),
-        overall_metrics: metrics, // Note: metrics is moved here (including its .anomalies field)
-        anomalies: anomalies_cloned, // Store the cloned list in TestSummary
+        overall_metrics: metrics, // Note: metrics is moved here (its .anomalies are now in TestSummary.anomalies)
+        anomalies,
         start_time_utc: String::from("N/A (TODO)"), // Will be set at actual test start
         end_time_utc: now_utc(), // Set at test end
         test_duration_actual_secs: actual_duration.as_secs_f64(),
@@ -103,26 +97,24 @@ pub fn generate_summary(
     }
 }
 
-// Later, this module will have functions to format TestSummary into HTML
-// or other report formats.
-
-#[cfg(test)]
-mod tests {
-    use super::*;
-    use crate::config::{Protocol, TestConfig, TestMode, TcpBidirectionalMode}; // Added more imports
-    use crate::metrics::TestMetrics; // Ensure TestMetrics is in scope
-    use std::time::{Duration, Instant}; // Added Instant for metrics.test_start_time
+/// Bandwidth chart data laid out as two parallel arrays (struct-of-arrays),
+/// which is exactly the shape Chart.js wants for `labels` and `data`.
+#[derive(serde::Serialize)]
+struct BandwidthChartData {
+    time: Vec<f64>,
+    mbps: Vec<f64>,
+}
 
 // Function to generate HTML report string
 pub fn generate_html_report_string(summary: &TestSummary) -> Result<String, askama::Error> {
-    // Prepare data for Chart.js
-    // Chart.js expects an array of objects like {time: seconds, mbps: value}
-    let chart_data_points: Vec<_> = summary.bandwidth_over_time.iter()
-        .map(|(time_sec, mbps_val)| serde_json::json!({"time": time_sec, "mbps": mbps_val}))
-        .collect();
+    // Prepare data for Chart.js as {time: [...], mbps: [...]}.
+    // Building a serde_json::Value object per sample allocated a map for every point;
+    // two plain f64 columns serialize directly and are consumed by the chart as-is.
+    let (time, mbps): (Vec<f64>, Vec<f64>) = summary.bandwidth_over_time.iter().copied().unzip();
+    let chart_data = BandwidthChartData { time, mbps };
 
-    let bandwidth_chart_data_json = serde_json::to_string(&chart_data_points)
-        .unwrap_or_else(|_| "[]".to_string()); // Default to empty array on serialization error
+    let bandwidth_chart_data_json = serde_json::to_string(&chart_data)
+        .unwrap_or_else(|_| r#"{"time":[],"mbps":[]}"#.to_string()); // Default to empty columns on serialization error
 
     let report_template = HtmlReport {
         summary,
@@ -131,6 +123,34 @@ pub fn generate_html_report_string(summary: &TestSummary) -> Result<String, aska
     report_template.render()
 }
 
+// Later, this module will have functions to format TestSummary into other report formats.
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::config::{Protocol, TestConfig, TestMode, TcpBidirectionalMode}; // Added more imports
+    use crate::metrics::TestMetrics; // Ensure TestMetrics is in scope
+    use std::time::{Duration, Instant}; // Added Instant for metrics.test_start_time
+
+    #[test]
+    fn test_process_bandwidth_samples_carries_zero_length_interval() {
+        let mut metrics = TestMetrics::default();
+        // Two samples in the same millisecond: the second interval has zero duration,
+        // so its bytes are folded into the following interval.
+        metrics.bandwidth_samples = vec![
+            (1000, 125000),
+            (1000, 125000),
+            (2000, 125000),
+        ];
+
+        let processed = process_bandwidth_samples(&metrics);
+        assert_eq!(processed.len(), 2);
+        assert_eq!(processed[0].0, 1.0);
+        assert!((processed[0].1 - 1.0).abs() < 0.001);
+        assert_eq!(processed[1].0, 2.0);
+        assert!((processed[1].1 - 2.0).abs() < 0.001);
+    }
+
     #[test]
     fn test_generate_summary_and_process_bandwidth() {
         let config = TestConfig {
@@ -143,6 +163,7 @@ pub fn generate_html_report_string(summary: &TestSummary) -> Result<String, aska
             protocol: Protocol::Udp,
             test_mode: TestMode::Client,
             tcp_bidirectional_mode: None,
+            ..Default::default()
         };
 
         let mut metrics = TestMetrics::default(); // Use default and populate
@@ -219,7 +240,8 @@ pub fn generate_html_report_string(summary: &TestSummary) -> Result<String, aska
         assert!(html_content.contains("<h2>Overall Metrics</h2>"));
         assert!(html_content.contains("id=\"bandwidthChart\""));
         assert!(html_content.contains("127.0.0.1")); // Check if config data is rendered
-        assert!(html_content.contains("1.00 Mbps")); // Check if a bandwidth value is rendered (approx)
+        assert!(html_content.contains("0.04 Mbps")); // Overall throughput: 45 * 512 B over 5.05 s
+        assert!(html_content.contains(r#""mbps":[1.0,1.04,0.96]"#)); // Chart data is embedded as raw JSON numbers
 
         // Optionally, write to a file for manual inspection:
         // use std::fs::File;
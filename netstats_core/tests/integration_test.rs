@@ -23,18 +23,17 @@ fn create_test_config(
         protocol,
         test_mode: mode,
         tcp_bidirectional_mode: tcp_bidi_mode,
+        ..Default::default()
     })
 }
 
-#[tokio::test]
-async fn test_udp_client_server_basic() {
-    let test_duration_secs = 1;
-    let port = 6001; // Unique port for this test
-
-    let server_config = create_test_config(Protocol::Udp, TestMode::Server, test_duration_secs, port, None);
+// Shared setup for the client/server tests: starts a server, gives it a moment to bind, runs a
+// client against it on loopback, and returns (client, server) metrics once both have finished.
+async fn run_client_server(protocol: Protocol, duration_secs: u64, port: u16) -> (TestMetrics, TestMetrics) {
+    let server_config = create_test_config(protocol, TestMode::Server, duration_secs, port, None);
     let server_metrics = Arc::new(Mutex::new(TestMetrics::default()));
 
-    let client_config = create_test_config(Protocol::Udp, TestMode::Client, test_duration_secs, port, None);
+    let client_config = create_test_config(protocol, TestMode::Client, duration_secs, port, None);
     let client_metrics = Arc::new(Mutex::new(TestMetrics::default()));
 
     let server_metrics_clone = Arc::clone(&server_metrics);
@@ -56,8 +55,18 @@ async fn test_udp_client_server_basic() {
     assert!(server_result.is_ok(), "Server error: {:?}", server_result.err());
     assert!(client_result.is_ok(), "Client error: {:?}", client_result.err());
 
-    let final_client_metrics = client_metrics.lock().unwrap();
-    let final_server_metrics = server_metrics.lock().unwrap();
+    let into_metrics = |metrics: Arc<Mutex<TestMetrics>>| {
+        Arc::try_unwrap(metrics).expect("test tasks have finished").into_inner().unwrap()
+    };
+    (into_metrics(client_metrics), into_metrics(server_metrics))
+}
+
+#[tokio::test]
+async fn test_udp_client_server_basic() {
+    let test_duration_secs = 1;
+    let port = 6001; // Unique port for this test
+
+    let (final_client_metrics, final_server_metrics) = run_client_server(Protocol::Udp, test_duration_secs, port).await;
 
     println!("Client Metrics: {:?}", final_client_metrics);
     println!("Server Metrics: {:?}", final_server_metrics);
@@ -77,11 +86,13 @@ async fn test_udp_client_server_basic() {
     assert!(final_client_metrics.bytes_sent > 0);
     assert!(final_server_metrics.bytes_received > 0);
 
-    // If server echoes EchoRequest, client might receive them.
-    // Current UDP server echoes EchoRequest, but client sends DataPacket.
-    // So client.packets_received would be 0 unless it's also setup to receive/process those echoes.
-    // For now, client doesn't process incoming UDP packets in send_loop.
-    assert_eq!(final_client_metrics.packets_received, 0, "Client should not receive UDP packets in this basic test");
+    // The client sends EchoRequests and the server echoes them, so the client records the
+    // replies it gets back along with their RTTs.
+    assert!(final_client_metrics.packets_received > 0, "Client should receive echo replies");
+    assert!(final_client_metrics.packets_received <= final_server_metrics.packets_received, "Client received more replies than server echoed");
+    // Not equal to packets_received: a loopback reply measured at 0µs records no RTT sample.
+    assert!(final_client_metrics.rtt_count > 0, "Client should record RTT samples");
+    assert!(final_client_metrics.rtt_count <= final_client_metrics.packets_received);
 
     // Check bandwidth samples were recorded on server
     assert!(!final_server_metrics.bandwidth_samples.is_empty(), "Server should have bandwidth samples");
@@ -93,32 +104,7 @@ async fn test_tcp_client_server_basic() {
     let test_duration_secs = 1;
     let port = 6002; // Unique port
 
-    let server_config = create_test_config(Protocol::Tcp, TestMode::Server, test_duration_secs, port, None);
-    let server_metrics = Arc::new(Mutex::new(TestMetrics::default()));
-
-    let client_config = create_test_config(Protocol::Tcp, TestMode::Client, test_duration_secs, port, None);
-    let client_metrics = Arc::new(Mutex::new(TestMetrics::default()));
-
-    let server_metrics_clone = Arc::clone(&server_metrics);
-    let server_handle = tokio::spawn(async move {
-        run_network_test(server_config, server_metrics_clone).await
-    });
-
-    tokio::time::sleep(Duration::from_millis(100)).await; // Server startup grace
-
-    let client_metrics_clone = Arc::clone(&client_metrics);
-    let client_handle = tokio::spawn(async move {
-        run_network_test(client_config, client_metrics_clone).await
-    });
-
-    let server_result = server_handle.await.unwrap();
-    let client_result = client_handle.await.unwrap();
-
-    assert!(server_result.is_ok(), "Server error: {:?}", server_result.err());
-    assert!(client_result.is_ok(), "Client error: {:?}", client_result.err());
-
-    let final_client_metrics = client_metrics.lock().unwrap();
-    let final_server_metrics = server_metrics.lock().unwrap();
+    let (final_client_metrics, final_server_metrics) = run_client_server(Protocol::Tcp, test_duration_secs, port).await;
 
     println!("TCP Client Metrics: {:?}", final_client_metrics);
     println!("TCP Server Metrics: {:?}", final_server_metrics);
@@ -131,8 +117,8 @@ async fn test_tcp_client_server_basic() {
     assert_eq!(final_server_metrics.packets_received, final_client_metrics.packets_sent, "TCP packet count mismatch between client and server");
 
     assert!(final_client_metrics.bytes_sent > 0);
-    // +4 for length prefix per packet
-    assert_eq!(final_server_metrics.bytes_received, final_client_metrics.bytes_sent + (final_client_metrics.packets_sent * 4));
+    // Both sides count whole frames, including the 4-byte length prefix
+    assert_eq!(final_server_metrics.bytes_received, final_client_metrics.bytes_sent);
 
     assert!(!final_server_metrics.bandwidth_samples.is_empty(), "Server should have TCP bandwidth samples");
 }
@@ -15,14 +15,14 @@ use slint::SharedString;
 fn main() -> Result<(), slint::PlatformError> {
     let ui = AppWindow::new()?;
 
-    let ui_handle = ui.as_weak(); // Weak handle for callbacks
-
     // --- State for Core Logic ---
     // Use Arc<Mutex<Option<TestSummary>>> to store the latest test result
     let latest_summary: Arc<Mutex<Option<TestSummary>>> = Arc::new(Mutex::new(None));
 
 
     // --- Callbacks ---
+    // Each callback captures its own weak handle
+    let ui_handle = ui.as_weak();
     ui.on_start_test_clicked(move || {
         let ui = ui_handle.unwrap();
         ui.set_test_in_progress(true);
@@ -86,6 +86,7 @@ fn main() -> Result<(), slint::PlatformError> {
             protocol,
             test_mode,
             tcp_bidirectional_mode: tcp_bidi_mode,
+            ..Default::default()
         });
 
         let metrics = Arc::new(Mutex::new(TestMetrics::default()));
@@ -141,25 +142,27 @@ fn main() -> Result<(), slint::PlatformError> {
                             actual_duration,
                         );
 
+                        let ui_handle_report = ui_handle_thread.clone();
                         let report_path_str = format!("netstats_report_{}.html", chrono::Local::now().format("%Y%m%d_%H%M%S"));
                         match netstats_core::reporter::generate_html_report_string(&summary) {
                             Ok(html_content) => {
-                                if let Err(e) = std::fs::write(&report_path_str, html_content) {
+                                if let Err(e) = write_report_atomically(&report_path_str, &html_content) {
                                     eprintln!("Failed to write HTML report: {}", e);
                                      let _ = slint::invoke_from_event_loop(move || {
-                                        ui_handle_thread.unwrap().set_status_text(SharedString::from(format!("Test complete. Failed to write report: {}",e)));
+                                        ui_handle_report.unwrap().set_status_text(SharedString::from(format!("Test complete. Failed to write report: {}",e)));
                                     });
                                 } else {
                                     let _ = slint::invoke_from_event_loop(move || {
-                                        ui_handle_thread.unwrap().set_html_report_path(report_path_str.clone().into());
-                                        ui_handle_thread.unwrap().set_status_text(SharedString::from(format!("Test complete! Report: {}", report_path_str)));
+                                        let ui = ui_handle_report.unwrap();
+                                        ui.set_html_report_path(report_path_str.clone().into());
+                                        ui.set_status_text(SharedString::from(format!("Test complete! Report: {}", report_path_str)));
                                     });
                                 }
                             }
                             Err(e) => {
                                 eprintln!("Failed to generate HTML report: {}", e);
                                  let _ = slint::invoke_from_event_loop(move || {
-                                    ui_handle_thread.unwrap().set_status_text(SharedString::from(format!("Test complete. Failed to gen HTML: {}",e)));
+                                    ui_handle_report.unwrap().set_status_text(SharedString::from(format!("Test complete. Failed to gen HTML: {}",e)));
                                 });
                             }
                         }
@@ -171,8 +174,9 @@ fn main() -> Result<(), slint::PlatformError> {
                     Err(e) => {
                         eprintln!("Network test error: {:?}", e);
                         let error_msg = format!("Test Error: {:?}", e);
+                        let ui_handle_error = ui_handle_thread.clone();
                          let _ = slint::invoke_from_event_loop(move || {
-                            ui_handle_thread.unwrap().set_status_text(SharedString::from(error_msg));
+                            ui_handle_error.unwrap().set_status_text(SharedString::from(error_msg));
                         });
                     }
                 }
@@ -180,15 +184,17 @@ fn main() -> Result<(), slint::PlatformError> {
 
             // Update UI after test completion (back on main thread via Slint event loop)
             let _ = slint::invoke_from_event_loop(move || {
-                 ui_handle_thread.unwrap().set_test_in_progress(false);
+                let ui = ui_handle_thread.unwrap();
+                ui.set_test_in_progress(false);
                 // Update summary text view if needed, or rely on report.
                 if let Some(summary_data) = summary_clone.lock().unwrap().as_ref() {
-                     ui_handle_thread.unwrap().set_results_summary(SharedString::from(format!("{:#?}", summary_data.overall_metrics)));
+                     ui.set_results_summary(SharedString::from(format_results_summary(summary_data)));
                 }
             });
         });
     });
 
+    let ui_handle = ui.as_weak();
     ui.on_open_report_clicked(move || {
         let ui = ui_handle.unwrap();
         let report_path = ui.get_html_report_path();
@@ -204,6 +210,7 @@ fn main() -> Result<(), slint::PlatformError> {
         }
     });
 
+    let ui_handle = ui.as_weak();
     ui.on_run_benchmark_clicked(move || {
         let ui = ui_handle.unwrap();
         ui.set_test_in_progress(true);
@@ -256,3 +263,62 @@ fn main() -> Result<(), slint::PlatformError> {
 
     ui.run()
 }
+
+/// Renders the results panel text. Anomalies are read from `summary.anomalies`:
+/// generate_summary moves them out of `overall_metrics`, so its own list is always empty.
+fn format_results_summary(summary: &TestSummary) -> String {
+    use std::fmt::Write;
+
+    let metrics = &summary.overall_metrics;
+    let as_ms = |micros: Option<f64>| micros.map_or("N/A".to_string(), |us| format!("{:.3} ms", us / 1000.0));
+    // Everything is written into this one buffer; there can be up to MAX_RECORDED_ANOMALIES lines.
+    let mut text = String::with_capacity(512 + 96 * summary.anomalies.len());
+    let _ = write!(
+        text,
+        "Duration: {:.2}s\nPackets Sent: {}\nPackets Received: {}\nBytes Sent: {}\nBytes Received: {}\nPacket Loss: {:.2}%\nAvg. RTT: {}\nAvg. Jitter: {}\nThroughput: {:.2} Mbps\nOut-of-Order Packets: {}\nDuplicate Packets: {}\n\nAnomalies: {}",
+        summary.test_duration_actual_secs,
+        metrics.packets_sent,
+        metrics.packets_received,
+        metrics.bytes_sent,
+        metrics.bytes_received,
+        metrics.packet_loss_percentage(),
+        as_ms(metrics.average_rtt_micros()),
+        as_ms(metrics.average_jitter_micros()),
+        metrics.overall_throughput_bps(summary.test_duration_actual_secs) / 1_000_000.0,
+        metrics.out_of_order_count,
+        metrics.duplicate_count,
+        summary.anomalies.len()
+    );
+    if metrics.anomalies_dropped > 0 {
+        let _ = write!(text, " (+{} not recorded)", metrics.anomalies_dropped);
+    }
+    for anomaly in &summary.anomalies {
+        let _ = write!(
+            text,
+            "\n[{:.3}s] {:?}: {}",
+            anomaly.timestamp_ms as f64 / 1000.0,
+            anomaly.anomaly_type,
+            anomaly.description
+        );
+    }
+    text
+}
+
+/// Writes the report to a temporary file next to `path` and renames it into place, so an
+/// existing report is never left half-written and "Open Report" only ever sees a complete file.
+/// The data is synced to disk before the rename, and the temporary file is removed if any step fails.
+fn write_report_atomically(path: &str, contents: &str) -> std::io::Result<()> {
+    use std::io::Write;
+
+    let tmp_path = format!("{}.tmp", path);
+    let result = std::fs::File::create(&tmp_path)
+        .and_then(|mut file| {
+            file.write_all(contents.as_bytes())?;
+            file.sync_all()
+        })
+        .and_then(|()| std::fs::rename(&tmp_path, path));
+    if result.is_err() {
+        let _ = std::fs::remove_file(&tmp_path);
+    }
+    result
+}